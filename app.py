@@ -1,8 +1,13 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 from io import BytesIO
-import requests, re, uuid
+from urllib.parse import quote, quote_plus
+import requests, re, uuid, hashlib, time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 st.set_page_config(page_title="Neitzel Lab Inventory", layout="wide", page_icon="🧪")
 
@@ -19,15 +24,40 @@ h1, h2, h3 { letter-spacing: 0.2px; }
 [data-testid="stDataFrame"] { border-radius: 12px; overflow: hidden; }
 """
 
-st.markdown(f"<style>{POLYMER_CSS}</style>", unsafe_allow_html=True)
+# Re-sent on full reruns only (fragment reruns skip module code). It can't be skipped
+# via session_state: Streamlit drops elements a rerun doesn't emit, which would unstyle the page.
+st.html(f"<style>{POLYMER_CSS}</style>")
 
-DATA_FILE = "chemicals_master.csv"
+# Working store: Parquet keeps dtypes, so loads skip CSV parsing and re-coercion.
+DATA_FILE = "chemicals_master.parquet"
+# Original CSV store; imported once into DATA_FILE if that doesn't exist yet
+LEGACY_CSV = "chemicals_master.csv"
+# Rows added since the last compaction, one small Parquet file per add
+PENDING_DIR = "chemicals_pending"
+# ROW_IDs deleted since the last compaction
+TOMBSTONES_FILE = "chemicals_tombstones.parquet"
+# Fold pending appends back into DATA_FILE once there are more than this many
+COMPACT_AFTER = 32
 EXPECTED_COLS = [
     "name", "cas", "carbons", "distributor", "container_size",
     "state", "location", "bottles", "storage_conditions", "hazards", "sds_link"
 ]
 # Unique row identifier used for precise deletes even when names are duplicated
 ROW_ID = "_row_id"
+# Columns matched by the Inventory search box, and the derived lowercase column holding them
+SEARCH_COLS = ["name", "cas", "hazards", "location", "distributor"]
+SEARCH_BLOB = "_search_blob"
+# Low-cardinality columns held as categoricals, free-text columns as Arrow strings
+CATEGORY_COLS = ["state", "location", "distributor", "storage_conditions"]
+TEXT_COLS = ["name", "cas", "hazards", "sds_link", "container_size"]
+# Carbon count from a molecular formula, e.g. "C3H6O" -> 3
+_FORMULA_C_RE = re.compile(r"C(\d+)")
+# CAS registry number, e.g. "67-64-1"
+_CAS_RE = re.compile(r"\d{2,7}-\d{2}-\d")
+# Characters not allowed in widget keys built from location names
+_KEY_SANITIZE = re.compile(r"[^A-Za-z0-9_]+")
+# Inventory table page sizes; views no longer than the first aren't paginated
+PAGE_SIZES = [50, 200, 1000]
 
 def template_csv_bytes():
     buf = BytesIO()
@@ -35,89 +65,364 @@ def template_csv_bytes():
     buf.seek(0)
     return buf
 
-def load_data() -> pd.DataFrame:
-    if os.path.exists(DATA_FILE):
-        try:
-            df = pd.read_csv(DATA_FILE)
-            # Ensure required columns
-            for c in EXPECTED_COLS:
-                if c not in df.columns:
-                    df[c] = pd.NA
-            # Create/repair unique row ids
-            if ROW_ID not in df.columns:
-                df[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(df))]
-            df[ROW_ID] = df[ROW_ID].astype(str)
-            # Clean types
-            df["bottles"] = pd.to_numeric(df["bottles"], errors="coerce").fillna(1).astype(int)
-            for c in ["name","cas","distributor","container_size","state","location","storage_conditions","hazards","sds_link"]:
-                df[c] = df[c].astype(str).replace({"nan":""}).fillna("")
-            df["carbons"] = pd.to_numeric(df["carbons"], errors="coerce")
-            # Return with ROW_ID so views can reference it
-            cols = EXPECTED_COLS + ([ROW_ID] if ROW_ID in df.columns else [])
-            return df[cols]
-        except Exception:
-            return pd.DataFrame(columns=EXPECTED_COLS + [ROW_ID])
-    return pd.DataFrame(columns=EXPECTED_COLS + [ROW_ID])
-    return pd.DataFrame(columns=EXPECTED_COLS)
-
-def save_data(df: pd.DataFrame):
-    df = df.copy()
+def _search_blob(df: pd.DataFrame) -> pd.Series:
+    """Join the searchable columns into one lowercase string per row."""
+    blob = df[SEARCH_COLS[0]].astype(str)
+    for c in SEARCH_COLS[1:]:
+        blob = blob + "\x1f" + df[c].astype(str)
+    return blob.str.lower().astype("string[pyarrow]")
+
+def _fill_row_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """Give rows without a ROW_ID a fresh uuid; existing ids are kept as-is."""
+    if ROW_ID in df.columns:
+        ids = df[ROW_ID].astype(str).str.strip()
+    else:
+        ids = pd.Series("", index=df.index, dtype=object)
+    # astype(str) spells missing values as "nan", "None" or "<NA>"
+    missing = ids.isin(["", "nan", "None", "<NA>"])
+    n = int(missing.sum())
+    if n:
+        ids.loc[missing] = [str(uuid.uuid4()) for _ in range(n)]
+    df[ROW_ID] = ids
+    return df
+
+def _dedupe_row_ids(df: pd.DataFrame, taken: pd.Series | None = None) -> pd.DataFrame:
+    """Give rows whose ROW_ID repeats an earlier row's (or one in taken) a fresh uuid."""
+    if ROW_ID not in df.columns:
+        return df
+    ids = df[ROW_ID].astype(object)
+    clash = ids.duplicated() & ids.notna()
+    if taken is not None:
+        clash |= ids.isin(taken)
+    n = int(clash.sum())
+    if n:
+        ids.loc[clash] = [str(uuid.uuid4()) for _ in range(n)]
+        df[ROW_ID] = ids
+    return df
+
+def _carbons_int(s: pd.Series) -> pd.Series:
+    """Carbon counts as nullable Int64 (blank / non-numeric -> <NA>)."""
+    return np.trunc(pd.to_numeric(s, errors="coerce").astype("float64")).astype("Int64")
+
+def _normalize_df(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Return df with the persisted schema (EXPECTED_COLS + ROW_ID) and clean types.
+    With copy=False the columns of df itself are rewritten in place.
+    """
+    if copy:
+        df = df.copy()
     # Ensure schema
     for c in EXPECTED_COLS:
         if c not in df.columns:
             df[c] = pd.NA
-    if ROW_ID not in df.columns:
-        df[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(df))]
-    df[ROW_ID] = df[ROW_ID].astype(str)
+    # Create/repair unique row ids
+    df = _fill_row_ids(df)
     # Normalize
     df["bottles"] = pd.to_numeric(df["bottles"], errors="coerce").fillna(1).astype(int)
+    df["carbons"] = _carbons_int(df["carbons"])
     for c in ["name","cas","distributor","container_size","state","location","storage_conditions","hazards","sds_link"]:
         df[c] = df[c].astype(str).replace({"nan":""}).fillna("")
+    # Compact dtypes: few distinct values -> categorical, free text -> Arrow-backed strings
+    for c in CATEGORY_COLS:
+        df[c] = df[c].astype("category")
+    for c in TEXT_COLS:
+        df[c] = df[c].astype("string[pyarrow]")
+    return df[EXPECTED_COLS + [ROW_ID]]
+
+def _set_value(df: pd.DataFrame, idx, col: str, value):
+    """df.at[idx, col] = value, adding the category first if col is categorical."""
+    if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+        df[col] = df[col].cat.add_categories([value])
+    df.at[idx, col] = value
+
+def _pending_parts() -> list[str]:
+    """Appended part files in PENDING_DIR, oldest first."""
+    try:
+        names = os.listdir(PENDING_DIR)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(PENDING_DIR, n) for n in sorted(names) if n.endswith(".parquet")]
+
+def _tombstone_ids() -> pd.Series:
+    """ROW_IDs deleted since the last compaction."""
+    try:
+        return pd.read_parquet(TOMBSTONES_FILE)[ROW_ID]
+    except FileNotFoundError:
+        return pd.Series([], dtype=object)
+
+def _read_store(columns: list[str] | None = None) -> pd.DataFrame | None:
+    """DATA_FILE plus pending appends, minus tombstoned rows; None when nothing is stored.
+    Re-read from a fresh listing if another session changes the store mid-read, e.g. its
+    compaction removes a part we listed or its tombstones after we read the old DATA_FILE.
+    """
+    for _ in range(5):
+        version = _data_version()
+        try:
+            df = _read_store_once(columns)
+        except FileNotFoundError:
+            continue
+        if _data_version() == version:
+            return df
+    raise RuntimeError("The inventory store kept changing while being read; please retry.")
+
+def _read_store_once(columns: list[str] | None) -> pd.DataFrame | None:
+    cols = None if columns is None else list(dict.fromkeys(columns + [ROW_ID]))
+    has_base = os.path.exists(DATA_FILE)
+    paths = ([DATA_FILE] if has_base else []) + _pending_parts()
+    if not paths:
+        return None
+    frames = [pd.read_parquet(p, columns=cols) for p in paths]
+    if len(frames) == 1:
+        df = frames[0]
+    elif has_base:
+        # A compaction interrupted before clearing PENDING_DIR leaves part rows already in
+        # DATA_FILE; drop only those, since DATA_FILE itself may repeat uploaded ids
+        parts = pd.concat(frames[1:], ignore_index=True)
+        parts = parts[~parts[ROW_ID].isin(frames[0][ROW_ID])]
+        df = pd.concat([frames[0], parts], ignore_index=True)
+    else:
+        df = pd.concat(frames, ignore_index=True)
+    dead = _tombstone_ids()
+    if len(dead):
+        df = df[~df[ROW_ID].isin(dead)].reset_index(drop=True)
+    return df
+
+def _is_normalized(df: pd.DataFrame) -> bool:
+    """True if df already has the layout and dtypes save_data() writes."""
+    return (
+        list(df.columns) == EXPECTED_COLS + [ROW_ID]
+        and df["carbons"].dtype == "Int64"
+        and all(isinstance(df[c].dtype, pd.CategoricalDtype) for c in CATEGORY_COLS)
+    )
+
+@st.cache_data(show_spinner=False)
+def _load_cached(version: tuple) -> pd.DataFrame:
+    """Read the inventory store.
+    Cached per store version so reruns don't re-read the files until they change.
+    st.cache_data hands every caller its own copy, so callers may mutate the result.
+    Read errors propagate (and aren't cached): an empty frame standing in for an unreadable
+    store would be written back over it by the next Append, Merge or compaction.
+    """
+    df = _read_store()
+    if df is None:
+        return pd.DataFrame(columns=EXPECTED_COLS + [ROW_ID])
+    # A lone file written by save_data() already carries the schema and dtypes;
+    # pending appends come back with their categoricals widened to object
+    if not _is_normalized(df):
+        df = _normalize_df(df)
+    # read_parquet brings string[pyarrow] columns back as string[python]; restore Arrow storage
+    for c in TEXT_COLS:
+        if df[c].dtype != "string[pyarrow]":
+            df[c] = df[c].astype("string[pyarrow]")
+    # Built once per store version; save_data() never persists it
+    df[SEARCH_BLOB] = _search_blob(df)
+    # Return with ROW_ID so views can reference it
+    return df
+
+def _location_values(loc: pd.Series) -> list[str]:
+    """Sorted, non-blank distinct values of a location column."""
+    if isinstance(loc.dtype, pd.CategoricalDtype):
+        # The stored categoricals already hold the distinct values; just prune ones no row uses
+        values = loc.cat.remove_unused_categories().cat.categories.astype(str)
+    else:
+        values = pd.Index(loc.dropna().astype(str).unique())
+    return sorted(values[values.str.strip() != ""].tolist())
+
+@st.cache_data(show_spinner=False)
+def _overview_cached(version: tuple) -> tuple[int, list[str]]:
+    """(row count, locations) of the store."""
+    # Project just the one column rather than copying the whole cached frame.
+    # Read errors propagate like _load_cached's, so nothing is cached for this version
+    df = _read_store(["location"])
+    if df is None:
+        return 0, []
+    return len(df), _location_values(df["location"])
+
+def _file_version(path: str) -> tuple[int, int]:
+    """(mtime_ns, size) of path; changes on any rewrite, even within one mtime tick."""
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        return (0, 0)
+    return (info.st_mtime_ns, info.st_size)
+
+def _data_version() -> tuple:
+    """Version of the whole store: the base file, the tombstones and the pending part names."""
+    return (_file_version(DATA_FILE), _file_version(TOMBSTONES_FILE), tuple(_pending_parts()))
+
+def _invalidate_cache():
+    """Drop cached reads of the store after it has been written."""
+    _load_cached.clear()
+    _overview_cached.clear()
+
+def load_data() -> pd.DataFrame:
+    return _load_cached(_data_version())
+
+def load_snapshot() -> tuple[pd.DataFrame, tuple]:
+    """load_data() plus the _data_version() it was read at, for handing back to save_data()."""
+    version = _data_version()
+    return _load_cached(version), version
+
+def load_locations() -> list[str]:
+    """Sorted, non-blank storage locations in the current inventory."""
+    return _overview_cached(_data_version())[1]
+
+def load_overview() -> tuple[int, list[str]]:
+    """Row count and load_locations() of the current inventory, from one cached read."""
+    return _overview_cached(_data_version())
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    """Write df beside path and swap it in, so a crash never leaves a half-written file."""
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.to_parquet(tmp, compression="zstd", index=False)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def save_data(df: pd.DataFrame, since: tuple | None = None):
+    """Write df as the whole inventory. df is normalized in place, so don't reuse it afterwards.
+    This also compacts the store: pending appends and tombstones are folded into DATA_FILE.
+    since is the _data_version() df was built from (see load_snapshot()); only the pending
+    parts and tombstones it covers are cleared, so adds and deletes other sessions made in
+    the meantime survive. Leave it None when df replaces the inventory outright.
+    Skipped when df matches what this session last wrote and the store hasn't changed since.
+    """
     # Persist with row ids so deletes are stable
-    cols = EXPECTED_COLS + [ROW_ID]
-    df[cols].to_csv(DATA_FILE, index=False)
+    df = _normalize_df(df, copy=False)
+    digest = hashlib.blake2b(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes(), digest_size=16).digest()
+    if st.session_state.get("_last_save") == (digest, _data_version()):
+        return
+    if since is None:
+        since = _data_version()
+    _write_parquet(df, DATA_FILE)
+    # Only cleared once DATA_FILE holds everything they recorded
+    _, seen_tombstones, seen_parts = since
+    for part in seen_parts:
+        try:
+            os.remove(part)
+        except FileNotFoundError:
+            pass  # Already folded in by another session's compaction
+    # A tombstones file rewritten since df was read holds deletes df doesn't reflect
+    if seen_tombstones != (0, 0) and _file_version(TOMBSTONES_FILE) == seen_tombstones:
+        os.remove(TOMBSTONES_FILE)
+    _invalidate_cache()
+    st.session_state["_last_save"] = (digest, _data_version())
+
+def compact_data():
+    """Fold pending appends and tombstones into a single DATA_FILE."""
+    save_data(*load_snapshot())
+
+def append_row(row: dict):
+    """Add a single entry to the inventory as a small part file, without rewriting DATA_FILE."""
+    os.makedirs(PENDING_DIR, exist_ok=True)
+    # time_ns first so parts sort (and load) in the order they were added
+    name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+    _write_parquet(_normalize_df(pd.DataFrame([row])), os.path.join(PENDING_DIR, name))
+    _invalidate_cache()
+    if len(_pending_parts()) > COMPACT_AFTER:
+        compact_data()
 
-# Enhanced external chemical info fetcher
-def fetch_details(query: str):
-    details = {"name": query, "cas": "", "carbons": "N/A", "formula": "", "hazards": "", "sds_link": f"https://www.google.com/search?q={query}+SDS"}
+def delete_rows(row_ids):
+    """Remove rows by ROW_ID by recording them in TOMBSTONES_FILE, without rewriting DATA_FILE."""
+    ids = pd.concat([_tombstone_ids(), pd.Series(list(row_ids), dtype=object)], ignore_index=True)
+    _write_parquet(pd.DataFrame({ROW_ID: ids.unique()}), TOMBSTONES_FILE)
+    _invalidate_cache()
+
+def _migrate_legacy_csv():
+    """Seed DATA_FILE from the legacy CSV store on first start."""
+    if not os.path.exists(DATA_FILE) and not _pending_parts() and os.path.exists(LEGACY_CSV):
+        save_data(pd.read_csv(LEGACY_CSV))
+
+@st.cache_resource
+def _http_session() -> requests.Session:
+    """Shared keep-alive session for PubChem lookups (survives reruns)."""
+    session = requests.Session()
+    session.headers.update({"Accept": "application/json"})
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+PUBCHEM_REST = "https://pubchem.ncbi.nlm.nih.gov/rest/pug"
+PUBCHEM_VIEW = "https://pubchem.ncbi.nlm.nih.gov/rest/pug_view"
+
+def _pubchem_json(http: requests.Session, url: str) -> dict:
+    """GET a PubChem JSON endpoint; returns {} when PubChem has no such record (404).
+    Transport failures and other bad responses raise requests.RequestException, so
+    fetch_details() isn't cached as if the chemical were unknown.
+    """
+    r = http.get(url, timeout=10)
+    if r.status_code == 404:
+        return {}
+    r.raise_for_status()
+    return r.json()
+
+# Where PUG-View files the GHS Classification section
+_GHS_PATH = ("Safety and Hazards", "Hazards Identification", "GHS Classification")
+
+def _ghs_statements(view_js: dict) -> list[str]:
+    """Collect GHS Classification strings from a PUG-View record via TOCHeading lookups."""
+    sec = view_js.get("Record", {})
+    for heading in _GHS_PATH:
+        by_heading = {s.get("TOCHeading"): s for s in sec.get("Section") or []}
+        sec = by_heading.get(heading)
+        if sec is None:
+            return []
+    return [
+        itm["String"]
+        for it in sec.get("Information", [])
+        for itm in it.get("StringWithMarkup", [])
+        if itm.get("String")
+    ]
+
+def _blank_details(query: str) -> dict:
+    """Add-form defaults for a query PubChem knows nothing about."""
+    return {
+        "name": query, "cas": "", "carbons": "N/A", "formula": "", "hazards": "",
+        # PubChem has no SDS links; point at a search instead
+        "sds_link": "https://www.google.com/search?q=" + quote_plus(query + " SDS"),
+    }
+
+# Enhanced external chemical info fetcher (cached per query for a day; failed lookups raise and aren't cached)
+@st.cache_data(ttl=24 * 3600, max_entries=512, show_spinner="Looking up PubChem…")
+def fetch_details(query: str) -> dict:
+    details = _blank_details(query)
+    http = _http_session()
     try:
-        # PubChem compound summary
-        cid_r = requests.get(f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{query}/cids/JSON", timeout=10)
-        if cid_r.status_code == 200 and "IdentifierList" in cid_r.json():
-            cid = cid_r.json()["IdentifierList"]["CID"][0]
-            summary_r = requests.get(f"https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data/compound/{cid}/JSON", timeout=10)
-            if summary_r.status_code == 200:
-                js = summary_r.json()
-                # Formula
-                for sec in js.get("Record", {}).get("Section", []):
-                    if sec.get("TOCHeading") == "Names and Identifiers":
-                        for s2 in sec.get("Section", []):
-                            if s2.get("TOCHeading") == "Molecular Formula":
-                                for it in s2.get("Information", []):
-                                    details["formula"] = it.get("StringValue", "")
-                                    if details["formula"]:
-                                        m = re.search(r"C(\d+)", details["formula"])
-                                        details["carbons"] = int(m.group(1)) if m else "N/A"
-                    if sec.get("TOCHeading") == "CAS":
-                        for it in sec.get("Information", []):
-                            details["cas"] = it.get("StringValue", "")
-                # Hazards
-                for sec in js.get("Record", {}).get("Section", []):
-                    if sec.get("TOCHeading") == "Safety and Hazards":
-                        for s2 in sec.get("Section", []):
-                            if s2.get("TOCHeading") == "GHS Classification":
-                                hazards = []
-                                for it in s2.get("Information", []):
-                                    for itm in it.get("StringWithMarkup", []):
-                                        hazards.append(itm.get("String", ""))
-                                details["hazards"] = "\n".join(hazards)
-                            if s2.get("TOCHeading") == "Safety Sources":
-                                for it in s2.get("Information", []):
-                                    for ref in it.get("Reference", []):
-                                        if ref.get("URL"):
-                                            details["sds_link"] = ref["URL"]
-                                            break
-    except Exception:
+        # Path-encode the name so "/", "+", "#" etc. in inputs don't break the lookup URL
+        cid_js = _pubchem_json(http, f"{PUBCHEM_REST}/compound/name/{quote(query, safe='')}/cids/JSON")
+        if "IdentifierList" in cid_js:
+            cid = cid_js["IdentifierList"]["CID"][0]
+            # Small targeted endpoints instead of the full PUG-View record, fetched concurrently
+            urls = {
+                "formula": f"{PUBCHEM_REST}/compound/cid/{cid}/property/MolecularFormula/JSON",
+                "synonyms": f"{PUBCHEM_REST}/compound/cid/{cid}/synonyms/JSON",
+                "rn": f"{PUBCHEM_REST}/compound/cid/{cid}/xrefs/RN/JSON",
+                "ghs": f"{PUBCHEM_VIEW}/data/compound/{cid}/JSON?heading=GHS+Classification",
+            }
+            with ThreadPoolExecutor(max_workers=len(urls)) as ex:
+                futures = {k: ex.submit(_pubchem_json, http, u) for k, u in urls.items()}
+                res = {k: f.result() for k, f in futures.items()}
+            # Formula
+            for prop in res["formula"].get("PropertyTable", {}).get("Properties", []):
+                details["formula"] = prop.get("MolecularFormula", "")
+                if details["formula"]:
+                    m = _FORMULA_C_RE.search(details["formula"])
+                    details["carbons"] = int(m.group(1)) if m else "N/A"
+            # CAS: registry-number xrefs first, synonyms as a fallback
+            for key, field in (("rn", "RN"), ("synonyms", "Synonym")):
+                for info in res[key].get("InformationList", {}).get("Information", []):
+                    cas = next((v for v in info.get(field, []) if _CAS_RE.fullmatch(v.strip())), "")
+                    if cas:
+                        details["cas"] = cas.strip()
+                        break
+                if details["cas"]:
+                    break
+            # Hazards
+            details["hazards"] = "\n".join(_ghs_statements(res["ghs"]))
+    except (KeyError, IndexError, TypeError, AttributeError):
+        # An unexpected response layout leaves the remaining fields blank
         pass
     return details
 
@@ -133,23 +438,29 @@ def _gsheets_enabled() -> bool:
         return False
 
 
-def _open_gsheets():
-    """Open the Google Sheet and return (worksheet, spreadsheet_url).
-    Requires Streamlit secrets with a [gsheets] section.
-    """
+@st.cache_resource
+def _gsheets_client():
+    """Authorized gspread client, kept across reruns so OAuth isn't redone per click."""
     import gspread  # imported only when needed
     from google.oauth2.service_account import Credentials
 
     cfg = dict(st.secrets["gsheets"])  # copy
-    spreadsheet_url = cfg.pop("spreadsheet_url")
+    cfg.pop("spreadsheet_url", None)
     cfg.pop("enabled", None)
     scope = [
         "https://www.googleapis.com/auth/spreadsheets",
         "https://www.googleapis.com/auth/drive",
     ]
     creds = Credentials.from_service_account_info(cfg, scopes=scope)
-    client = gspread.authorize(creds)
-    sh = client.open_by_url(spreadsheet_url)
+    return gspread.authorize(creds)
+
+
+def _open_gsheets():
+    """Open the Google Sheet and return (worksheet, spreadsheet_url).
+    Requires Streamlit secrets with a [gsheets] section.
+    """
+    spreadsheet_url = st.secrets["gsheets"]["spreadsheet_url"]
+    sh = _gsheets_client().open_by_url(spreadsheet_url)
     ws = sh.sheet1
     return ws, spreadsheet_url
 
@@ -166,19 +477,32 @@ def _ensure_schema_for_backup(df: pd.DataFrame) -> pd.DataFrame:
         df[c] = df[c].astype(str).replace({"nan": ""}).fillna("")
     df["bottles"] = pd.to_numeric(df["bottles"], errors="coerce").fillna(1).astype(int)
     df["carbons"] = pd.to_numeric(df["carbons"], errors="coerce")
-    if ROW_ID not in df.columns:
-        df[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(df))]
-    df[ROW_ID] = df[ROW_ID].astype(str)
+    df = _fill_row_ids(df)
     return df[EXPECTED_COLS + [ROW_ID]]
 
 
 def _backup_to_gsheets(df: pd.DataFrame):
-    """Write the current inventory to Google Sheets (overwrites sheet1)."""
+    """Write the current inventory to Google Sheets (overwrites sheet1) in one API call."""
     ws, _ = _open_gsheets()
     df = _ensure_schema_for_backup(df)
-    data = [EXPECTED_COLS] + df[EXPECTED_COLS].astype(str).values.tolist()
-    ws.clear()
-    ws.update("A1", data)
+    data = [EXPECTED_COLS] + df[EXPECTED_COLS].astype("string").fillna("").values.tolist()
+    batch = []
+    # updateCells can't write past the grid, unlike a values update; grow it first
+    for dimension, need, have in (("ROWS", len(data), ws.row_count), ("COLUMNS", len(EXPECTED_COLS), ws.col_count)):
+        if need > have:
+            batch.append({"appendDimension": {"sheetId": ws.id, "dimension": dimension, "length": need - have}})
+    batch += [
+        # Clear every value (formatting is kept) so a longer previous backup leaves nothing stale
+        {"updateCells": {"range": {"sheetId": ws.id}, "fields": "userEnteredValue"}},
+        {"updateCells": {
+            "start": {"sheetId": ws.id, "rowIndex": 0, "columnIndex": 0},
+            # Blank cells are sent empty rather than as "" strings
+            "rows": [{"values": [{"userEnteredValue": {"stringValue": v}} if v else {} for v in row]} for row in data],
+            "fields": "userEnteredValue",
+        }},
+    ]
+    # Requests in one batchUpdate are applied in order, atomically
+    ws.spreadsheet.batch_update({"requests": batch})
 
 
 def _restore_from_gsheets() -> pd.DataFrame:
@@ -198,37 +522,100 @@ def _restore_from_gsheets() -> pd.DataFrame:
         df["bottles"] = pd.to_numeric(df["bottles"], errors="coerce").fillna(1).astype(int)
     if "carbons" in df.columns:
         df["carbons"] = pd.to_numeric(df["carbons"], errors="coerce")
-    if ROW_ID not in df.columns:
-        df[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(df))]
-    df[ROW_ID] = df[ROW_ID].astype(str)
+    df = _fill_row_ids(df)
     return df[EXPECTED_COLS + [ROW_ID]]
 
 # =============================
 # UI Tabs
 # =============================
 
-t1, t2, t3, t4 = st.tabs(["Inventory", "Add Chemicals", "Upload / Merge", "Settings"])
+_migrate_legacy_csv()
+
+def _saved(tab: str, message: str):
+    """Report a successful write with a full-app rerun.
+    Tabs are fragments, so without it the Inventory tab keeps showing the old rows.
+    """
+    st.session_state[f"_saved_{tab}"] = message
+    st.rerun()
+
+def _show_saved(tab: str):
+    """Show the message _saved() left for this tab before the rerun."""
+    message = st.session_state.pop(f"_saved_{tab}", None)
+    if message:
+        st.success(message)
 
 # ---------- Inventory ----------
-with t1:
+@st.fragment
+def inventory_tab():
     st.title("🔬 Neitzel Lab Inventory")
-    df = load_data()
+    try:
+        # Just the count and locations here; only the view fragment loads the full frame
+        n_rows, locations = load_overview()
+    except Exception as e:
+        # Keep the other tabs (e.g. Restore from Sheets) usable while the store can't be read
+        st.error(f"Couldn't read the inventory: {e}")
+        return
 
-    search_q = st.text_input("Search (name/CAS/hazards)")
+    # Form-gated: typing doesn't rerun the views, only Enter / Search does
+    with st.form("search_form", border=False):
+        c1, c2 = st.columns([5, 1], vertical_alignment="bottom")
+        with c1:
+            search_q = st.text_input("Search (name/CAS/hazards)", key="search_q")
+        with c2:
+            st.form_submit_button("🔎 Search", use_container_width=True)
 
-    if not df.empty:
-        locations = sorted([x for x in df["location"].dropna().unique().tolist() if str(x).strip()])
-        tabs = st.tabs(["All"] + locations)
+    if n_rows:
+        loc_options = ["All"] + locations
+        # A radio instead of st.tabs: only the selected location is rendered
+        if st.session_state.get("active_loc_tab") not in loc_options:
+            st.session_state["active_loc_tab"] = "All"
+        active_loc = st.radio("Location", loc_options, horizontal=True, key="active_loc_tab")
+        # Widget-key suffix per location, kept distinct when names sanitize alike ("Shelf A" / "Shelf-A")
+        slugs, taken = {}, set()
+        for loc in loc_options:
+            slug = _KEY_SANITIZE.sub("_", loc)
+            while slug in taken:
+                slug += "_"
+            slugs[loc] = slug
+            taken.add(slug)
 
-        def render_view(view_df, loc_label):
-            key_suffix = re.sub(r'[^A-Za-z0-9_]+','_', str(loc_label))
-            view = view_df.copy()
+        def render_view(df, version, view_df, loc_label, locations, key_suffix):
+            view = view_df
             if search_q:
-                ql = search_q.lower()
-                view = view[view.apply(lambda r: any(ql in str(r[c]).lower() for c in ["name","cas","hazards","location","distributor"]), axis=1)]
-            display = view.copy()
-            display["carbons"] = display["carbons"].apply(lambda x: int(x) if pd.notna(x) else "N/A")
-            display["state"] = display["state"].apply(lambda x: x if str(x).strip() else "N/A")
+                view = view[view[SEARCH_BLOB].str.contains(search_q.lower(), regex=False, na=False)]
+            # Send at most one page of rows to the frontend
+            n_rows = len(view)
+            start, page_size = 0, max(n_rows, 1)
+            if n_rows > PAGE_SIZES[0]:
+                p1, p2, p3 = st.columns([1, 1, 3], vertical_alignment="bottom")
+                with p1:
+                    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"ps_{key_suffix}")
+                n_pages = -(-n_rows // page_size)
+                pg_key = f"pg_{key_suffix}"
+                # A narrower search or bigger page size can leave the stored page out of range
+                if st.session_state.get(pg_key, 1) > n_pages:
+                    st.session_state[pg_key] = n_pages
+                with p2:
+                    page = st.number_input("Page", min_value=1, max_value=n_pages, step=1, key=pg_key)
+                start = (page - 1) * page_size
+                with p3:
+                    st.caption(f"Rows {start + 1}–{min(start + page_size, n_rows)} of {n_rows}")
+            page_view = view.iloc[start:start + page_size]
+
+            # Label the handful of state categories once, then take by code (-1 -> trailing "N/A")
+            state = page_view["state"].astype("category")
+            labels = state.cat.categories.astype(str).str.strip()
+            labels = np.append(np.where(labels == "", "N/A", labels), "N/A")
+            overrides = {
+                "carbons": page_view["carbons"].astype("string").fillna("N/A"),
+                "state": pd.Series(labels[state.cat.codes.to_numpy()], index=page_view.index),
+            }
+            # Only the display-formatted columns are new; the rest share page_view's arrays.
+            # ROW_ID stays out: row actions read it from view, and it's just payload on the wire
+            display = pd.DataFrame(
+                {c: overrides[c] if c in overrides else page_view[c] for c in EXPECTED_COLS},
+                copy=False,
+            )
             st.data_editor(
                 display,
                 use_container_width=True,
@@ -240,115 +627,137 @@ with t1:
             )
             if loc_label != "All":
                 if st.button(f"Delete all in {loc_label}", key=f"del_{key_suffix}"):
-                    save_data(df[df["location"] != loc_label])
+                    delete_rows(df.loc[df["location"].to_numpy() == loc_label, ROW_ID])
                     st.success("Deleted successfully.")
 
-            # Single-row delete selector (safe)
-            st.markdown("**Delete a single row (safe):**")
-            if ROW_ID in view.columns and len(view) > 0:
-                options = []
-                for _, r in view.iterrows():
-                    label = f"{r.get('name','')} | CAS:{r.get('cas','') or '-'} | Size:{r.get('container_size','') or '-'} | Loc:{r.get('location','') or '-'} | Bottles:{r.get('bottles','')} | ID:{str(r[ROW_ID])[:8]}"
-                    options.append((label, str(r[ROW_ID])))
-                labels = [lab for lab, _ in options]
-                selected_label = st.selectbox("Pick row to delete", labels, key=f"rowdel_select_{key_suffix}")
-                selected_id = dict(options).get(selected_label)
-                if st.button("🗑️ Delete selected row", key=f"rowdel_btn_{key_suffix}", disabled=(selected_id is None)):
-                    new_df = df[~df[ROW_ID].astype(str).eq(selected_id)]
-                    save_data(new_df)
-                    st.success("Row deleted. Refresh to see changes.")
-
-                # ----------------- Edit single row -----------------
-                st.markdown("**Edit a single row:**")
-                # Reuse the same options list for labels
-                options_e = options
-                labels_e = labels
-                selected_label_e = st.selectbox("Pick row to edit", labels_e, key=f"rowedit_select_{key_suffix}")
-                selected_id_e = dict(options_e).get(selected_label_e)
-
-                if selected_id_e:
-                    match_idx = df.index[df[ROW_ID].astype(str).eq(selected_id_e)]
-                    if len(match_idx) == 0:
-                        st.warning("Could not find the selected row. Try refreshing.")
-                    else:
-                        idx = match_idx[0]
-                        current_row = df.loc[idx]
-                        with st.form(f"edit_form_{key_suffix}"):
-                            c1, c2 = st.columns(2)
-                            with c1:
-                                e_name = st.text_input("Chemical Name", value=str(current_row.get("name","")), key=f"e_name_{key_suffix}")
-                                e_cas = st.text_input("CAS Number", value=str(current_row.get("cas","")), key=f"e_cas_{key_suffix}")
-                                e_carbons = st.text_input("Carbons", value=("" if pd.isna(current_row.get("carbons")) else str(current_row.get("carbons",""))), key=f"e_carbons_{key_suffix}")
-                                e_distributor = st.text_input("Distributor", value=str(current_row.get("distributor","")), key=f"e_dist_{key_suffix}")
-                                e_size = st.text_input("Container Size", value=str(current_row.get("container_size","")), key=f"e_size_{key_suffix}")
-                            with c2:
-                                state_options = ["Solid","Liquid","Gas","Unknown"]
-                                cur_state = str(current_row.get("state","Unknown")) or "Unknown"
-                                try:
-                                    state_index = state_options.index(cur_state) if cur_state in state_options else 3
-                                except Exception:
-                                    state_index = 3
-                                e_state = st.selectbox("State", state_options, index=state_index, key=f"e_state_{key_suffix}")
-
-                                df_now = load_data()
-                                locations_existing = sorted([x for x in df_now["location"].dropna().unique().tolist() if str(x).strip()])
-                                default_loc = str(current_row.get("location",""))
-                                initial_options = ["(new)"] + locations_existing
-                                try:
-                                    init_index = initial_options.index(default_loc) if default_loc in initial_options else 0
-                                except Exception:
-                                    init_index = 0
-                                e_location_choice = st.selectbox("Storage Location", options=initial_options, index=init_index, key=f"e_loc_choice_{key_suffix}")
-                                if e_location_choice == "(new)":
-                                    e_location = st.text_input("Enter new location", value=default_loc, key=f"e_loc_new_{key_suffix}")
+            # Row selectors and the edit form are only built when asked for
+            if st.toggle("Edit or delete a single row", key=f"rows_open_{key_suffix}"):
+                st.markdown("**Delete a single row (safe):**")
+                if ROW_ID in view.columns and len(view) > 0:
+                    def _or_dash(col):
+                        return view[col].astype(str).replace("", "-")
+                    labels = (
+                        view["name"].astype(str) + " | CAS:" + _or_dash("cas")
+                        + " | Size:" + _or_dash("container_size") + " | Loc:" + _or_dash("location")
+                        + " | Bottles:" + view["bottles"].astype(str) + " | ID:" + view[ROW_ID].astype(str).str.slice(0, 8)
+                    ).tolist()
+                    # view is a slice of df, so its index labels address rows in df directly
+                    label_to_idx = dict(zip(labels, view.index))
+                    selected_label = st.selectbox("Pick row to delete", labels, key=f"rowdel_select_{key_suffix}")
+                    selected_idx = label_to_idx.get(selected_label)
+                    if st.button("🗑️ Delete selected row", key=f"rowdel_btn_{key_suffix}", disabled=(selected_idx is None)):
+                        delete_rows([df.at[selected_idx, ROW_ID]])
+                        st.success("Row deleted. Refresh to see changes.")
+
+                    # ----------------- Edit single row -----------------
+                    st.markdown("**Edit a single row:**")
+                    # Reuse the same labels
+                    selected_label_e = st.selectbox("Pick row to edit", labels, key=f"rowedit_select_{key_suffix}")
+                    idx = label_to_idx.get(selected_label_e)
+
+                    if idx is not None:
+                        if idx not in df.index:
+                            st.warning("Could not find the selected row. Try refreshing.")
+                        else:
+                            current_row = df.loc[idx]
+                            with st.form(f"edit_form_{key_suffix}"):
+                                c1, c2 = st.columns(2)
+                                with c1:
+                                    e_name = st.text_input("Chemical Name", value=str(current_row.get("name","")), key=f"e_name_{key_suffix}")
+                                    e_cas = st.text_input("CAS Number", value=str(current_row.get("cas","")), key=f"e_cas_{key_suffix}")
+                                    e_carbons = st.text_input("Carbons", value=("" if pd.isna(current_row.get("carbons")) else str(current_row.get("carbons",""))), key=f"e_carbons_{key_suffix}")
+                                    e_distributor = st.text_input("Distributor", value=str(current_row.get("distributor","")), key=f"e_dist_{key_suffix}")
+                                    e_size = st.text_input("Container Size", value=str(current_row.get("container_size","")), key=f"e_size_{key_suffix}")
+                                with c2:
+                                    state_options = ["Solid","Liquid","Gas","Unknown"]
+                                    cur_state = str(current_row.get("state","Unknown")) or "Unknown"
+                                    try:
+                                        state_index = state_options.index(cur_state) if cur_state in state_options else 3
+                                    except Exception:
+                                        state_index = 3
+                                    e_state = st.selectbox("State", state_options, index=state_index, key=f"e_state_{key_suffix}")
+
+                                    default_loc = str(current_row.get("location",""))
+                                    initial_options = ["(new)"] + locations
+                                    try:
+                                        init_index = initial_options.index(default_loc) if default_loc in initial_options else 0
+                                    except Exception:
+                                        init_index = 0
+                                    e_location_choice = st.selectbox("Storage Location", options=initial_options, index=init_index, key=f"e_loc_choice_{key_suffix}")
+                                    if e_location_choice == "(new)":
+                                        e_location = st.text_input("Enter new location", value=default_loc, key=f"e_loc_new_{key_suffix}")
+                                    else:
+                                        e_location = e_location_choice
+
+                                    e_bottles = st.number_input("Number of Bottles", min_value=1, value=int(current_row.get("bottles",1) or 1), key=f"e_bottles_{key_suffix}")
+                                    e_storage = st.text_input("Storage Conditions", value=str(current_row.get("storage_conditions","")), key=f"e_storage_{key_suffix}")
+                                    e_haz = st.text_area("Hazards (from SDS)", value=str(current_row.get("hazards","")), key=f"e_haz_{key_suffix}")
+                                    e_sds = st.text_input("Link to SDS", value=str(current_row.get("sds_link","")), key=f"e_sds_{key_suffix}")
+
+                                save_edit = st.form_submit_button("💾 Save changes")
+                            if save_edit:
+                                df.at[idx, "name"] = e_name
+                                df.at[idx, "cas"] = e_cas
+                                if e_carbons and str(e_carbons).strip():
+                                    try:
+                                        df.at[idx, "carbons"] = int(e_carbons)
+                                    except Exception:
+                                        df.at[idx, "carbons"] = pd.NA
                                 else:
-                                    e_location = e_location_choice
-
-                                e_bottles = st.number_input("Number of Bottles", min_value=1, value=int(current_row.get("bottles",1) or 1), key=f"e_bottles_{key_suffix}")
-                                e_storage = st.text_input("Storage Conditions", value=str(current_row.get("storage_conditions","")), key=f"e_storage_{key_suffix}")
-                                e_haz = st.text_area("Hazards (from SDS)", value=str(current_row.get("hazards","")), key=f"e_haz_{key_suffix}")
-                                e_sds = st.text_input("Link to SDS", value=str(current_row.get("sds_link","")), key=f"e_sds_{key_suffix}")
-
-                            save_edit = st.form_submit_button("💾 Save changes")
-                        if save_edit:
-                            df.at[idx, "name"] = e_name
-                            df.at[idx, "cas"] = e_cas
-                            if e_carbons and str(e_carbons).strip():
-                                try:
-                                    df.at[idx, "carbons"] = int(e_carbons)
-                                except Exception:
                                     df.at[idx, "carbons"] = pd.NA
-                            else:
-                                df.at[idx, "carbons"] = pd.NA
-                            df.at[idx, "distributor"] = e_distributor
-                            df.at[idx, "container_size"] = e_size
-                            df.at[idx, "state"] = e_state
-                            df.at[idx, "location"] = e_location
-                            df.at[idx, "bottles"] = int(e_bottles) if e_bottles else 1
-                            df.at[idx, "storage_conditions"] = e_storage
-                            df.at[idx, "hazards"] = e_haz
-                            df.at[idx, "sds_link"] = e_sds
-                            save_data(df)
-                            st.success("Row updated. Switch tabs or refresh to see changes.")
-            else:
-                st.caption("No rows to delete in this view.")
-
-        with tabs[0]:
-            render_view(df, "All")
-        for i, loc in enumerate(locations, start=1):
-            with tabs[i]:
-                render_view(df[df["location"] == loc], loc)
+                                _set_value(df, idx, "distributor", e_distributor)
+                                df.at[idx, "container_size"] = e_size
+                                _set_value(df, idx, "state", e_state)
+                                _set_value(df, idx, "location", e_location)
+                                df.at[idx, "bottles"] = int(e_bottles) if e_bottles else 1
+                                _set_value(df, idx, "storage_conditions", e_storage)
+                                df.at[idx, "hazards"] = e_haz
+                                df.at[idx, "sds_link"] = e_sds
+                                save_data(df, version)
+                                st.success("Row updated. Switch tabs or refresh to see changes.")
+                else:
+                    st.caption("No rows to delete in this view.")
+
+        # Row actions rerun only the view, not the search box / location picker
+        @st.fragment
+        def _loc_view(loc_label, key_suffix):
+            # Reload (cached) so a fragment rerun never edits a stale frame
+            df, version = load_snapshot()
+            view_df = df if loc_label == "All" else df[df["location"] == loc_label]
+            # Locations for the edit form come from the frame already in hand
+            render_view(df, version, view_df, loc_label, _location_values(df["location"]), key_suffix)
+
+        _loc_view(active_loc, slugs[active_loc])
     else:
         st.info("No data in inventory yet.")
 
     st.download_button("⬇️ Download CSV Template", data=template_csv_bytes(), file_name="inventory_template.csv", mime="text/csv")
 
 # ---------- Add Chemicals ----------
-with t2:
+@st.fragment
+def add_tab():
     st.title("➕ Add New Chemical")
+    _show_saved("add")
     query = st.text_input("Enter chemical name or CAS number:")
     if query:
-        details = fetch_details(query)
+        # Case/whitespace variants share one cache entry; PubChem name lookups ignore both
+        q = " ".join(query.split()).lower()
+        # Only look up again when the normalized query actually changed
+        if st.session_state.get("_last_query") != q:
+            st.session_state["_last_query"] = q
+            st.session_state.pop("_lookup_error", None)
+            try:
+                # One- or two-letter inputs are practically always partial; skip the round trip
+                found = fetch_details(q) if len(q) >= 3 else _blank_details(q)
+            except requests.RequestException as e:
+                found = _blank_details(q)
+                st.session_state["_lookup_error"] = str(e)
+            st.session_state["_last_details"] = {**found, "name": query.strip()}
+        details = st.session_state["_last_details"]
+        if st.session_state.get("_lookup_error"):
+            st.warning(f"PubChem lookup failed, so the details below weren't filled in: {st.session_state['_lookup_error']}")
+            # Failed lookups aren't cached, so forgetting the query makes the rerun ask PubChem again
+            st.button("Retry lookup", on_click=lambda: st.session_state.pop("_last_query", None))
         with st.form("add_form"):
             col1, col2 = st.columns(2)
             with col1:
@@ -360,8 +769,11 @@ with t2:
                 container_size = st.text_input("Container Size")
             with col2:
                 state = st.selectbox("State", ["Solid", "Liquid", "Gas", "Unknown"])
-                df_now = load_data()
-                locations_existing = sorted([x for x in df_now["location"].dropna().unique().tolist() if str(x).strip()])
+                try:
+                    locations_existing = load_locations()
+                except Exception:
+                    # Unreadable store (the Inventory tab says why); new locations can still be typed
+                    locations_existing = []
                 location = st.selectbox("Storage Location", options=["(new)"] + locations_existing)
                 if location == "(new)":
                     location = st.text_input("Enter new location")
@@ -371,7 +783,6 @@ with t2:
                 sds_link = st.text_input("Link to SDS", value=details.get("sds_link", ""))
             submitted = st.form_submit_button("Add to Inventory")
         if submitted:
-            df = load_data()
             new_entry = {
                 "name": chem_name,
                 "cas": cas,
@@ -386,48 +797,62 @@ with t2:
                 "sds_link": sds_link,
                 ROW_ID: str(uuid.uuid4()),
             }
-            df = pd.concat([df, pd.DataFrame([new_entry])], ignore_index=True)
-            save_data(df)
-            st.success(f"{chem_name} added to inventory ✅")
+            append_row(new_entry)
+            _saved("add", f"{chem_name} added to inventory ✅")
 
 # ---------- Upload / Merge ----------
-with t3:
+@st.fragment
+def upload_tab():
     st.title("📂 Upload or Merge Spreadsheet(s)")
     st.caption("Upload CSV or Excel. You can Replace, Append, or Merge/Upsert into the current inventory.")
+    _show_saved("upload")
 
-    # --- File readers with Excel engines ---
-    def _read_table(file):
-        name = file.name.lower()
-        ext = os.path.splitext(name)[1]
-        try:
-            if ext == ".csv":
-                return pd.read_csv(file)
-            elif ext in (".xlsx", ".xlsm", ".xltx", ".xltm"):
-                return pd.read_excel(file, engine="openpyxl")
-            elif ext == ".xls":
-                return pd.read_excel(file, engine="xlrd")
-            elif ext == ".ods":
-                return pd.read_excel(file, engine="odf")
-            else:
-                raise ValueError(f"Unsupported file type: {ext}")
-        except ImportError as e:
-            st.error(
-                "Missing Excel engine. Add the following to requirements.txt and redeploy:"
-                "`openpyxl` (for .xlsx), `xlrd` (for .xls), `odfpy` (for .ods)."
-                f"Details: {e}"
+    # --- File readers (Arrow-backed CSV, Rust-backed calamine for spreadsheets) ---
+    upload_cols = {c.lower() for c in EXPECTED_COLS + [ROW_ID]}
+
+    def _is_upload_col(col) -> bool:
+        return str(col).strip().lower() in upload_cols
+
+    # Cached on the file name + contents so reruns of this tab don't re-parse the upload.
+    # Bounded: entries hold whole parsed files (preview and full) and the cache is shared by all sessions
+    @st.cache_data(show_spinner=False, max_entries=16, ttl=15 * 60)
+    def _read_table(name: str, data: bytes, nrows: int | None = None):
+        ext = os.path.splitext(name.lower())[1]
+        if ext == ".csv":
+            try:
+                if nrows is None:
+                    df = pd.read_csv(BytesIO(data), engine="pyarrow", dtype_backend="pyarrow")
+                else:
+                    # Arrow's reader can't stop early; the C engine parses just the rows asked for
+                    df = pd.read_csv(BytesIO(data), nrows=nrows, dtype_backend="pyarrow")
+            except ValueError:
+                # Arrow's reader is strict; pandas' python engine copes with odd quoting.
+                # Keep the comma delimiter: sniffing it splits single-column files on arbitrary letters
+                df = pd.read_csv(BytesIO(data), engine="python", nrows=nrows, dtype_backend="pyarrow")
+        elif ext in (".xlsx", ".xlsm", ".xltx", ".xltm", ".xls", ".ods"):
+            # Only build frames for inventory columns; sheets often carry many unrelated ones
+            df = pd.read_excel(
+                BytesIO(data), engine="calamine", dtype_backend="pyarrow", usecols=_is_upload_col, nrows=nrows
             )
-            raise
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+        # Headers are matched case- and space-insensitively, e.g. "Name " -> "name"
+        return df.rename(columns=lambda c: str(c).strip().lower())
 
     # --- Normalization helper (align columns/types) ---
-    def _ensure_schema(df: pd.DataFrame) -> pd.DataFrame:
+    def _ensure_schema(df: pd.DataFrame, already_normalized: bool = False) -> pd.DataFrame:
+        if already_normalized:
+            # load_data() output already has the stored dtypes; just drop helper columns
+            return df[EXPECTED_COLS + [ROW_ID]]
         df = df.copy()
         for c in EXPECTED_COLS:
             if c not in df.columns:
                 df[c] = pd.NA
         for c in ["name","cas","distributor","container_size","state","location","storage_conditions","hazards","sds_link"]:
-            df[c] = df[c].astype(str).replace({"nan": ""}).fillna("")
+            # Arrow-backed uploads stringify missing values as "<NA>" rather than "nan"
+            df[c] = df[c].astype(str).replace({"nan": "", "<NA>": ""}).fillna("")
         df["bottles"] = pd.to_numeric(df["bottles"], errors="coerce").fillna(1).astype(int)
-        df["carbons"] = pd.to_numeric(df["carbons"], errors="coerce")
+        df["carbons"] = _carbons_int(df["carbons"])
         keep_cols = EXPECTED_COLS + ([ROW_ID] if ROW_ID in df.columns else [])
         return df[keep_cols]
 
@@ -435,8 +860,13 @@ with t3:
         """Build a normalized composite key (case-insensitive) for matching."""
         if not keys:
             return pd.Series([""] * len(df), index=df.index)
-        subset = df.reindex(columns=keys, fill_value="").astype(str)
-        return subset.apply(lambda row: "::".join(str(x).strip().lower() for x in row.values), axis=1)
+        subset = df.reindex(columns=keys, fill_value="")
+        key = None
+        for k in keys:
+            # Stringify before filling: stored categoricals and Int64 columns reject a "" fill
+            part = subset[k].astype("string").fillna("").str.strip().str.lower()
+            key = part if key is None else key + "::" + part
+        return key
 
     # --- Uploader ---
     uploaded_files = st.file_uploader(
@@ -446,17 +876,49 @@ with t3:
         key="upload_merge_files",
     )
 
-    if uploaded_files is not None and len(uploaded_files) > 0:
+    def _read_uploads(files, nrows: int | None = None) -> list[pd.DataFrame]:
+        """Parse files in parallel; errors are still reported per file, in upload order."""
+        with ThreadPoolExecutor(max_workers=min(8, len(files))) as ex:
+            futures = [(f.name, ex.submit(_read_table, f.name, f.getvalue(), nrows)) for f in files]
         frames = []
-        for f in uploaded_files:
+        for name, fut in futures:
             try:
-                frames.append(_read_table(f))
+                frames.append(fut.result())
+            except ImportError as e:
+                st.error(
+                    "Missing spreadsheet engine. Add `python-calamine` to requirements.txt and redeploy. "
+                    f"Details: {e}"
+                )
             except Exception as e:
-                st.error(f"Failed to read {f.name}: {e}")
-        if frames:
-            uploaded = pd.concat(frames, ignore_index=True)
+                st.error(f"Failed to read {name}: {e}")
+        return frames
+
+    def _concat_uploads(frames: list[pd.DataFrame]) -> pd.DataFrame:
+        """One concat over frames pre-aligned to the inventory columns; extra columns are dropped."""
+        # A column missing from one file is added with the dtype another file gave it,
+        # so concat neither re-infers from all-NA fillers nor upcasts to object
+        dtypes = {}
+        for f in frames:
+            for c in f.columns:
+                if c in upload_cols:
+                    dtypes.setdefault(c, f[c].dtype)
+        cols = [c for c in EXPECTED_COLS + [ROW_ID] if c in dtypes]
+        aligned = [
+            pd.DataFrame(
+                {c: f[c] if c in f.columns else pd.Series(None, index=f.index, dtype=dtypes[c]) for c in cols},
+                copy=False,
+            )
+            for f in frames
+        ]
+        return pd.concat(aligned, ignore_index=True, sort=False, copy=False)
+
+    if uploaded_files is not None and len(uploaded_files) > 0:
+        # Preview from the first rows only; files are parsed in full when the upload is applied
+        preview_frames = _read_uploads(uploaded_files, nrows=100)
+        if preview_frames:
+            preview = _concat_uploads(preview_frames)
             st.subheader("Preview (first 100 rows)")
-            st.dataframe(uploaded.head(100), use_container_width=True)
+            st.dataframe(preview.head(100), use_container_width=True)
 
             # --- Apply mode ---
             mode = st.radio(
@@ -469,14 +931,12 @@ with t3:
                 index=2,
             )
 
-            current = load_data()
-
             # Merge settings (only shown for Merge/Upsert)
             key_cols = []
             prefer_uploaded = True
             if mode == "Merge/Upsert (match rows and update)":
                 st.markdown("**Match settings**")
-                avail = list(uploaded.columns)
+                avail = list(preview.columns)
                 default_keys = [c for c in ["name", "cas", "location"] if c in avail]
                 key_cols = st.multiselect(
                     "Columns to match on (choose 1+)",
@@ -494,85 +954,102 @@ with t3:
                 prefer_uploaded = strategy.startswith("Prefer uploaded")
 
             if st.button("Apply Upload", type="primary"):
-                if mode.startswith("Replace"):
-                    to_save = _ensure_schema(uploaded)
-                    if ROW_ID not in to_save.columns:
-                        to_save[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(to_save))]
+                frames = _read_uploads(uploaded_files)
+                uploaded = _concat_uploads(frames) if frames else None
+                current, version = load_snapshot()
+                if uploaded is None:
+                    st.error("None of the uploaded files could be read.")
+                elif mode.startswith("Replace"):
+                    to_save = _dedupe_row_ids(_ensure_schema(uploaded))
                     save_data(to_save)
-                    st.success(f"Replaced inventory with {len(to_save)} rows.")
+                    _saved("upload", f"Replaced inventory with {len(to_save)} rows.")
 
                 elif mode.startswith("Append"):
-                    up = _ensure_schema(uploaded)
-                    cur = _ensure_schema(current)
-                    if ROW_ID not in up.columns:
-                        up[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(up))]
+                    cur = _ensure_schema(current, already_normalized=True)
+                    # Uploaded ids that repeat each other or an existing row get fresh ones
+                    up = _dedupe_row_ids(_ensure_schema(uploaded), cur[ROW_ID])
                     combined = pd.concat([cur, up], ignore_index=True)
-                    save_data(combined)
-                    st.success(f"Appended {len(up)} rows (new total: {len(combined)}).")
+                    save_data(combined, version)
+                    _saved("upload", f"Appended {len(up)} rows (new total: {len(combined)}).")
 
                 else:  # Merge/Upsert
                     if not key_cols:
                         st.error("Pick at least one match column for merge.")
                     else:
-                        up = _ensure_schema(uploaded).copy()
-                        cur = _ensure_schema(current).copy()
+                        up = _ensure_schema(uploaded)
+                        cur = _ensure_schema(current, already_normalized=True)
                         cur["__merge_key"] = _make_keycols(cur, key_cols)
                         up["__merge_key"] = _make_keycols(up, key_cols)
 
-                        updated = 0
-                        inserted = 0
-
-                        key_to_idx = {}
-                        for idx, k in cur["__merge_key"].items():
-                            key_to_idx.setdefault(k, []).append(idx)
-
-                        def _nonempty(val) -> bool:
-                            if pd.isna(val):
-                                return False
-                            if isinstance(val, str):
-                                return bool(val.strip())
-                            return True
-
-                        for _, urow in up.iterrows():
-                            k = urow["__merge_key"]
-                            if k in key_to_idx and len(key_to_idx[k]) > 0:
-                                idx = key_to_idx[k][0]
-                                changed = False
-                                for c in EXPECTED_COLS:
-                                    if c == ROW_ID:
-                                        continue
-                                    uval = urow.get(c, pd.NA)
-                                    cval = cur.at[idx, c] if c in cur.columns else pd.NA
-                                    if prefer_uploaded:
-                                        if _nonempty(uval) and (str(uval) != str(cval)):
-                                            cur.at[idx, c] = uval
-                                            changed = True
-                                    else:
-                                        if (not _nonempty(cval)) and _nonempty(uval):
-                                            cur.at[idx, c] = uval
-                                            changed = True
-                                if changed:
-                                    updated += 1
+                        def _nonempty(s: pd.Series) -> pd.Series:
+                            return s.notna() & s.astype(str).str.strip().ne("")
+
+                        # Each upload row targets the first current row with its key
+                        first_idx = pd.Series(cur.index, index=cur["__merge_key"])
+                        first_idx = first_idx[~first_idx.index.duplicated()]
+                        target = up["__merge_key"].map(first_idx)
+                        hit = target.notna()
+
+                        # Collapse repeated upload keys the way sequential upserts would:
+                        # last non-empty value wins, or the first one when only filling blanks
+                        cols = [c for c in EXPECTED_COLS if c != ROW_ID]
+                        matched = up.loc[hit, cols]
+                        matched = matched.where(matched.apply(_nonempty))
+                        grouped = matched.groupby(target[hit].astype(int).to_numpy())
+                        agg = grouped.last() if prefer_uploaded else grouped.first()
+
+                        changed = pd.Series(False, index=agg.index)
+                        for c in cols:
+                            uval = agg[c]
+                            cval = cur.loc[agg.index, c]
+                            if prefer_uploaded:
+                                take = uval.notna() & (uval.astype(str) != cval.astype(str))
                             else:
-                                new_row = {c: urow.get(c, pd.NA) for c in EXPECTED_COLS}
-                                new_row[ROW_ID] = str(uuid.uuid4())
-                                cur = pd.concat([cur, pd.DataFrame([new_row])], ignore_index=True)
-                                inserted += 1
+                                take = uval.notna() & ~_nonempty(cval)
+                            if take.any():
+                                vals = uval[take]
+                                if isinstance(cur[c].dtype, pd.CategoricalDtype):
+                                    new_cats = pd.Index(vals.unique()).difference(cur[c].cat.categories)
+                                    if len(new_cats):
+                                        cur[c] = cur[c].cat.add_categories(new_cats)
+                                cur.loc[vals.index, c] = vals.to_numpy()
+                                changed |= take
+                        updated = int(changed.sum())
+
+                        new_rows = up.loc[~hit, EXPECTED_COLS].copy()
+                        new_rows[ROW_ID] = [str(uuid.uuid4()) for _ in range(len(new_rows))]
+                        inserted = len(new_rows)
+                        if inserted:
+                            cur = pd.concat([cur, new_rows], ignore_index=True)
 
                         if "__merge_key" in cur.columns:
                             cur = cur.drop(columns=["__merge_key"]) 
-                        save_data(cur)
-                        st.success(f"Merge complete: updated {updated}, inserted {inserted}. Total rows: {len(cur)}.")
+                        save_data(cur, version)
+                        _saved("upload", f"Merge complete: updated {updated}, inserted {inserted}. Total rows: {len(cur)}.")
     else:
         st.info("No files uploaded yet.")
 
-with t4:
+# ---------- Settings ----------
+@st.fragment
+def settings_tab():
     st.title("⚙️ Settings & Tips")
+    _show_saved("settings")
 
     # Quick reset
     if st.button("Reset to blank inventory"):
         save_data(pd.DataFrame(columns=EXPECTED_COLS + [ROW_ID]))
-        st.success("Inventory reset.")
+        _saved("settings", "Inventory reset.")
+
+    st.divider()
+    st.subheader("Storage")
+    n_parts, n_dead = len(_pending_parts()), len(_tombstone_ids())
+    st.caption(
+        f"{n_parts} added and {n_dead} deleted rows are waiting to be folded into `{DATA_FILE}` "
+        f"(done automatically after {COMPACT_AFTER} adds, or on any edit or upload)."
+    )
+    if st.button("Compact now", disabled=not (n_parts or n_dead)):
+        compact_data()
+        st.success("Storage compacted.")
 
     st.divider()
     st.subheader("Google Sheets backup")
@@ -595,7 +1072,7 @@ with t4:
                 try:
                     restored = _restore_from_gsheets()
                     save_data(restored)
-                    st.success(f"Restored {len(restored)} rows from Google Sheets.")
+                    _saved("settings", f"Restored {len(restored)} rows from Google Sheets.")
                 except Exception as e:
                     st.error(f"Restore failed: {e}")
         with c3:
@@ -607,3 +1084,14 @@ with t4:
                     st.error(f"Connection failed: {e}")
     else:
         st.info("To enable, add `gspread` and `google-auth` to requirements, then set Streamlit Secrets with a [gsheets] block (enabled=true, spreadsheet_url, and service account JSON fields). Share the sheet with the service account email.")
+
+# Each tab is its own fragment, so widget interaction in one tab only reruns that tab
+t1, t2, t3, t4 = st.tabs(["Inventory", "Add Chemicals", "Upload / Merge", "Settings"])
+with t1:
+    inventory_tab()
+with t2:
+    add_tab()
+with t3:
+    upload_tab()
+with t4:
+    settings_tab()
@@ -0,0 +1,62 @@
+"""Shared fixtures: each test runs app.py with AppTest in its own scratch working directory."""
+import os
+import shutil
+
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+class Upload:
+    """Stands in for st.file_uploader's UploadedFile; AppTest can't drive the uploader."""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.size = len(data)
+        self._data = data
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+
+def run(at: AppTest) -> AppTest:
+    at.run()
+    assert not at.exception, [e.message for e in at.exception]
+    return at
+
+
+def open_app(store) -> AppTest:
+    return run(AppTest.from_file(str(store / "app.py"), default_timeout=60))
+
+
+def call_app(store, body: str):
+    """Run app.py, then body with the app's globals as `app`; returns st.session_state["result"]."""
+    script = "import runpy\nimport streamlit as st\napp = runpy.run_path('app.py')\n" + body
+    at = run(AppTest.from_string(script, default_timeout=60))
+    return at.session_state["result"] if "result" in at.session_state else None
+
+
+def stored_names(store) -> list[str]:
+    """Names in the inventory as load_data() sees it, sorted."""
+    return call_app(store, 'st.session_state["result"] = sorted(app["load_data"]()["name"].astype(str))')
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Seed the app's working directory with a store whose location column has no blanks
+    (so no "" category) and whose carbons column has a missing value.
+    """
+    shutil.copy(APP, tmp_path)
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame(
+        [
+            {"name": "Acetone", "cas": "67-64-1", "carbons": 3, "location": "Shelf A", "bottles": 1},
+            {"name": "Toluene", "cas": "108-88-3", "carbons": None, "location": "Shelf B", "bottles": 2},
+        ]
+    ).to_csv("chemicals_master.csv", index=False)
+    # The first run migrates the CSV into the parquet store
+    open_app(tmp_path)
+    assert os.path.exists("chemicals_master.parquet")
+    return tmp_path
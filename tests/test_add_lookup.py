@@ -0,0 +1,48 @@
+"""PubChem lookups on the Add tab, with the network faked out."""
+import requests
+
+from conftest import open_app, run
+
+
+class _Response:
+    def __init__(self, status_code: int, payload: dict | None = None):
+        self.status_code = status_code
+        self._payload = payload or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return self._payload
+
+
+def test_failed_lookup_is_not_cached(store, monkeypatch):
+    calls = []
+    online = {"up": False}
+
+    def fake_get(self, url, **kwargs):
+        calls.append(url)
+        if not online["up"]:
+            raise requests.ConnectionError("network is down")
+        if "/property/MolecularFormula/" in url:
+            return _Response(200, {"PropertyTable": {"Properties": [{"MolecularFormula": "C3H6O"}]}})
+        if "/cids/" in url:
+            return _Response(200, {"IdentifierList": {"CID": [180]}})
+        return _Response(404)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    at = open_app(store)
+    [t for t in at.text_input if t.label == "Enter chemical name or CAS number:"][0].input("acetone")
+    run(at)
+    assert [w.value for w in at.warning if w.value.startswith("PubChem lookup failed")]
+    assert [t for t in at.text_input if t.label == "Formula"][0].value == ""
+
+    online["up"] = True
+    calls.clear()
+    [b for b in at.button if b.label == "Retry lookup"][0].click()
+    run(at)
+    assert calls, "retry should go back to PubChem"
+    assert not [w for w in at.warning if w.value.startswith("PubChem lookup failed")]
+    assert [t for t in at.text_input if t.label == "Formula"][0].value == "C3H6O"
+    assert [t for t in at.text_input if t.label == "Carbons"][0].value == "3"
@@ -0,0 +1,107 @@
+"""The parquet store: pending appends, tombstoned deletes and their compaction."""
+import os
+
+import pandas as pd
+import streamlit
+
+from conftest import Upload, call_app, open_app, run, stored_names
+
+PENDING_DIR = "chemicals_pending"
+TOMBSTONES_FILE = "chemicals_tombstones.parquet"
+
+
+def _pending():
+    return os.listdir(PENDING_DIR) if os.path.isdir(PENDING_DIR) else []
+
+
+def _add(store, name: str):
+    at = open_app(store)
+    # Queries under three characters skip the PubChem lookup
+    [t for t in at.text_input if t.label == "Enter chemical name or CAS number:"][0].input("zz")
+    run(at)
+    [t for t in at.text_input if t.label == "Chemical Name"][0].input(name)
+    [t for t in at.text_input if t.label == "Enter new location"][0].input("Shelf C")
+    [b for b in at.button if b.label == "Add to Inventory"][0].click()
+    run(at)
+    # The write reruns the whole app; the message survives it
+    assert [s.value for s in at.success] == [f"{name} added to inventory ✅"]
+
+
+def test_add_delete_and_compact(store):
+    _add(store, "Benzene")
+    # The add lands in a part file; DATA_FILE isn't rewritten
+    assert len(_pending()) == 1
+    assert len(pd.read_parquet("chemicals_master.parquet")) == 2
+    assert stored_names(store) == ["Acetone", "Benzene", "Toluene"]
+
+    at = open_app(store)
+    at.toggle(key="rows_open_All").set_value(True)
+    run(at)
+    pick = at.selectbox(key="rowdel_select_All")
+    pick.set_value([o for o in pick.options if o.startswith("Toluene")][0])
+    run(at)
+    at.button(key="rowdel_btn_All").click()
+    run(at)
+    assert os.path.exists(TOMBSTONES_FILE)
+    assert stored_names(store) == ["Acetone", "Benzene"]
+
+    at = open_app(store)
+    [b for b in at.button if b.label == "Compact now"][0].click()
+    run(at)
+    assert not _pending() and not os.path.exists(TOMBSTONES_FILE)
+    assert sorted(pd.read_parquet("chemicals_master.parquet")["name"].astype(str)) == ["Acetone", "Benzene"]
+
+
+def test_appended_upload_ids_survive_later_adds(store, monkeypatch):
+    # An exported inventory re-uploaded with Append repeats every stored _row_id
+    exported = call_app(store, 'st.session_state["result"] = app["load_data"]().drop(columns="_search_blob").to_csv(index=False)')
+    with monkeypatch.context() as m:
+        m.setattr(streamlit, "file_uploader", lambda *a, **k: [Upload("export.csv", exported.encode())])
+        at = open_app(store)
+        [r for r in at.radio if r.label.startswith("How should")][0].set_value("Append (add rows)")
+        run(at)
+        [b for b in at.button if b.label == "Apply Upload"][0].click()
+        run(at)
+
+    assert pd.read_parquet("chemicals_master.parquet")["_row_id"].is_unique
+    _add(store, "Benzene")
+    assert stored_names(store) == ["Acetone", "Acetone", "Benzene", "Toluene", "Toluene"]
+    call_app(store, 'app["compact_data"]()')
+    assert sorted(pd.read_parquet("chemicals_master.parquet")["name"].astype(str)) == [
+        "Acetone", "Acetone", "Benzene", "Toluene", "Toluene",
+    ]
+
+
+def test_save_since_keeps_writes_made_after_the_snapshot(store):
+    # Another session adds and deletes between this session's load and its save
+    call_app(store, """
+df, version = app["load_snapshot"]()
+app["append_row"]({"name": "Benzene", "location": "Shelf C"})
+other, _ = app["load_snapshot"]()
+app["delete_rows"](other.loc[other["name"] == "Toluene", "_row_id"])
+df.loc[df["name"] == "Acetone", "bottles"] = 4
+app["save_data"](df, version)
+""")
+    assert stored_names(store) == ["Acetone", "Benzene"]
+    # The edit made it to DATA_FILE while the later part and tombstone were left in place
+    base = pd.read_parquet("chemicals_master.parquet")
+    assert int(base.loc[base["name"] == "Acetone", "bottles"].iloc[0]) == 4
+    assert len(_pending()) == 1 and os.path.exists(TOMBSTONES_FILE)
+
+
+def test_repeated_ids_in_data_file_are_kept_on_read(store):
+    # Stores written before uploads got fresh ids can repeat one in DATA_FILE
+    call_app(store, """
+df = app["load_data"]()
+app["save_data"](app["pd"].concat([df, df.head(1)], ignore_index=True))
+""")
+    _add(store, "Benzene")
+    assert stored_names(store) == ["Acetone", "Acetone", "Benzene", "Toluene"]
+
+
+def test_loaded_text_columns_keep_arrow_storage(store):
+    storage = call_app(store, """
+df = app["load_data"]()
+st.session_state["result"] = {c: df[c].dtype.storage for c in app["TEXT_COLS"]}
+""")
+    assert set(storage.values()) == {"pyarrow"}, storage
@@ -0,0 +1,27 @@
+"""Merge/Upsert uploads against a store read back from parquet."""
+import pandas as pd
+import pytest
+import streamlit
+
+from conftest import Upload, open_app, run
+
+
+@pytest.mark.parametrize("keys", [["name", "cas", "location"], ["carbons"]])
+def test_merge_into_parquet_store(store, monkeypatch, keys):
+    upload = pd.DataFrame(
+        [
+            {"name": "Acetone", "cas": "67-64-1", "carbons": 3, "location": "Shelf A", "bottles": 5},
+            {"name": "Ethanol", "cas": "64-17-5", "carbons": 2, "location": "Shelf A", "bottles": 1},
+        ]
+    ).to_csv(index=False).encode()
+    monkeypatch.setattr(streamlit, "file_uploader", lambda *a, **k: [Upload("up.csv", upload)])
+
+    at = open_app(store)
+    [m for m in at.multiselect if m.label.startswith("Columns to match on")][0].set_value(keys)
+    run(at)
+    [b for b in at.button if b.label == "Apply Upload"][0].click()
+    run(at)
+
+    df = pd.read_parquet("chemicals_master.parquet")
+    assert sorted(df["name"].astype(str)) == ["Acetone", "Ethanol", "Toluene"]
+    assert int(df.loc[df["name"] == "Acetone", "bottles"].iloc[0]) == 5